@@ -3,12 +3,23 @@ import os
 import re
 import unicodedata
 from datetime import datetime
+from functools import lru_cache
 
+import numpy as np
 import pandas as pd
 import plotly.express as px
 import plotly.graph_objects as go
 import streamlit as st
 
+try:
+    import pyarrow as pa
+    import pyarrow.compute as pc
+except ImportError:
+    pa = None
+    CSV_READ_KWARGS = {"engine": "c"}
+else:
+    CSV_READ_KWARGS = {"engine": "pyarrow", "dtype_backend": "pyarrow"}
+
 DATA_FILES = {
     "ciclo2": "Ciclo2.csv",
     "ciclo3": "Ciclo3.csv",
@@ -16,6 +27,9 @@ DATA_FILES = {
     "geral": "Geral.csv",
 }
 
+# Pasta do cache em disco do Streamlit (~/.streamlit/cache); guarda as mtimes do ultimo load_data persistido
+DATA_CACHE_MARKER = os.path.join(os.path.expanduser("~"), ".streamlit", "cache", "load_data.mtimes")
+
 CAPEX_COL_MAP = {
     "ufv": "ufv",
     "natureza": "natureza",
@@ -43,37 +57,53 @@ FIN_COL_MAP = {
     "nodanf": "numero_nf",
 }
 
+_NON_ALNUM = re.compile(r"[^a-z0-9]+")
+_HAS_ALNUM = re.compile(r"[A-Za-z0-9]")
+
 
 # -------------------------
 # Helpers
 # -------------------------
 
+@lru_cache(maxsize=512)
 def normalize_col(name: str) -> str:
     text = str(name).strip()
-    text = unicodedata.normalize("NFKD", text)
-    text = "".join(ch for ch in text if not unicodedata.combining(ch))
+    text = unicodedata.normalize("NFKD", text).encode("ascii", "ignore").decode("ascii")
     text = text.lower()
-    text = re.sub(r"[^a-z0-9]+", "", text)
+    text = _NON_ALNUM.sub("", text)
     return text
 
 
 def detect_header_row(path: str, marker: str = "UFV", max_rows: int = 25) -> int:
+    target = marker.upper()
     try:
         with open(path, "r", encoding="utf-8", errors="ignore", newline="") as f:
-            reader = csv.reader(f)
-            for i, row in enumerate(reader):
+            # csv.reader conta linhas como o read_csv(header=N): aspas, \r e campos multilinha
+            for i, row in enumerate(csv.reader(f)):
                 if i >= max_rows:
                     break
-                if any(cell.strip().upper() == marker.upper() for cell in row):
+                if any(cell.strip().upper() == target for cell in row):
                     return i
     except Exception:
         pass
     return 0
 
 
+def read_csv_file(path: str, header: int = 0) -> pd.DataFrame:
+    return pd.read_csv(
+        path,
+        header=header,
+        sep=",",
+        quotechar='"',
+        doublequote=True,
+        escapechar=None,
+        **CSV_READ_KWARGS,
+    )
+
+
 def read_csv_guess_header(path: str, marker: str = "UFV") -> pd.DataFrame:
     header_row = detect_header_row(path, marker=marker)
-    return pd.read_csv(path, header=header_row, engine="python")
+    return read_csv_file(path, header=header_row)
 
 
 def drop_junk_columns(df: pd.DataFrame) -> pd.DataFrame:
@@ -86,27 +116,36 @@ def drop_junk_columns(df: pd.DataFrame) -> pd.DataFrame:
         if name.lower().startswith("unnamed"):
             drop_cols.append(col)
             continue
-        if not re.search(r"[A-Za-z0-9]", name):
+        if not _HAS_ALNUM.search(name):
             drop_cols.append(col)
     return df.drop(columns=drop_cols, errors="ignore")
 
 
-def to_number(series: pd.Series) -> pd.Series:
+def to_number(series: pd.Series, dtype=np.float64) -> pd.Series:
+    if pd.api.types.is_numeric_dtype(series):
+        return series.astype(dtype).fillna(0)
+    # strip explicito: to_numeric so ignora espaco ASCII, nao o NBSP dos exports
     s = series.astype(str).str.strip()
-    has_comma = s.str.contains(",", na=False)
-    s = s.where(~has_comma, s.str.replace(".", "", regex=False))
-    s = s.str.replace(",", ".", regex=False)
-    return pd.to_numeric(s, errors="coerce").fillna(0)
+    has_comma = s.str.contains(",", regex=False, na=False)
+    if has_comma.any():
+        # Formato BR (1.234,56): remove separador de milhar so nas celulas com virgula
+        s = s.where(~has_comma, s.str.replace(".", "", regex=False))
+        s = s.str.replace(",", ".", regex=False)
+    return pd.to_numeric(s, errors="coerce").astype(dtype).fillna(0)
+
+
+def normalize_key(series: pd.Series) -> pd.Series:
+    dtype = series.dtype
+    if pa is not None and isinstance(dtype, pd.ArrowDtype) and pa.types.is_string(dtype.pyarrow_dtype):
+        # Um kernel Arrow para trim + upper, sem passar celula a celula pelo Python
+        arr = pc.utf8_upper(pc.utf8_trim_whitespace(pa.array(series)))
+        return pd.Series(pd.arrays.ArrowExtensionArray(arr), index=series.index, name=series.name)
+    return series.astype(str).str.strip().str.upper()
 
 
 def standardize_capex(df: pd.DataFrame) -> pd.DataFrame:
     df = drop_junk_columns(df)
-    rename = {}
-    for col in df.columns:
-        key = normalize_col(col)
-        if key in CAPEX_COL_MAP:
-            rename[col] = CAPEX_COL_MAP[key]
-    df = df.rename(columns=rename)
+    df.columns = [CAPEX_COL_MAP.get(normalize_col(col), col) for col in df.columns]
 
     for col in [
         "contrato_original",
@@ -115,33 +154,31 @@ def standardize_capex(df: pd.DataFrame) -> pd.DataFrame:
         "medicao",
         "fd_medicao",
         "saldo_a_medir",
-        "avanco_contratual",
-        "avanco_obra",
     ]:
         if col in df.columns:
             df[col] = to_number(df[col])
 
+    # Percentuais so servem para exibicao: float32 basta. Valores em R$ seguem float64
+    for col in ["avanco_contratual", "avanco_obra"]:
+        if col in df.columns:
+            df[col] = to_number(df[col], dtype=np.float32)
+
     if "fd_medicao" not in df.columns:
         df["fd_medicao"] = df.get("fd_medido", 0) + df.get("medicao", 0)
 
     if "ufv" in df.columns:
-        df["ufv"] = df["ufv"].astype(str).str.strip().str.upper()
+        df["ufv"] = normalize_key(df["ufv"])
 
     return df
 
 
 def standardize_fin(df: pd.DataFrame) -> pd.DataFrame:
-    rename = {}
-    for col in df.columns:
-        key = normalize_col(col)
-        if key in FIN_COL_MAP:
-            rename[col] = FIN_COL_MAP[key]
-    df = df.rename(columns=rename)
+    df.columns = [FIN_COL_MAP.get(normalize_col(col), col) for col in df.columns]
 
     if "valor_nf" in df.columns:
         df["valor_nf"] = to_number(df["valor_nf"])
     if "ufv_pag" in df.columns:
-        df["ufv_pag"] = df["ufv_pag"].astype(str).str.strip().str.upper()
+        df["ufv_pag"] = normalize_key(df["ufv_pag"]).astype("category")
 
     return df
 
@@ -155,24 +192,35 @@ def normalize_fluxo(df: pd.DataFrame) -> pd.DataFrame:
         return pd.DataFrame()
 
     base_cols = [c for c in df.columns if c not in month_cols]
-    df_long = df.melt(id_vars=base_cols, value_vars=month_cols, var_name="mes", value_name="valor")
-    df_long["valor"] = to_number(df_long["valor"])
-    return df_long
+    n_rows = len(df)
+    # Mesmo layout do melt (mes a mes, todas as linhas), sem o concat por bloco
+    row_idx = np.tile(np.arange(n_rows), len(month_cols))
+    data = {c: df[c].array.take(row_idx) for c in base_cols}
+    data["mes"] = np.repeat(np.asarray(month_cols, dtype=object), n_rows)
+    data["valor"] = to_number(pd.Series(df[month_cols].to_numpy(dtype=object).ravel(order="F")))
+    return pd.DataFrame(data)
 
 
 def pct_from_series(series: pd.Series) -> float:
-    if series.empty:
-        return 0.0
-    s = series.dropna()
-    if s.empty:
+    arr = series.to_numpy(dtype=np.float64, na_value=np.nan)
+    arr = arr[~np.isnan(arr)]
+    if arr.size == 0:
         return 0.0
-    max_v = s.max()
-    avg = s.mean()
+    max_v = arr.max()
+    avg = arr.mean()
     return (avg * 100.0) if max_v <= 1.5 else avg
 
 
-def last_update_label(paths: list[str]) -> str:
-    mtimes = [os.path.getmtime(p) for p in paths if os.path.exists(p)]
+def file_mtimes(paths: list[str]) -> tuple:
+    # Uma leitura do diretorio em vez de exists + getmtime por arquivo
+    wanted = set(paths)
+    with os.scandir(".") as entries:
+        found = {e.name: e.stat().st_mtime for e in entries if e.name in wanted and e.is_file()}
+    return tuple(found.get(p) for p in paths)
+
+
+def last_update_label(mtimes: tuple) -> str:
+    mtimes = [m for m in mtimes if m is not None]
     if not mtimes:
         return ""
     ts = datetime.fromtimestamp(max(mtimes)).strftime("%Y-%m-%d %H:%M")
@@ -185,8 +233,9 @@ def last_update_label(paths: list[str]) -> str:
 
 st.set_page_config(page_title="Painel de Gestao - Obras GD", layout="wide")
 
-@st.cache_data
-def load_data():
+@st.cache_data(persist="disk", show_spinner=False)
+def load_data(mtimes: tuple):
+    # mtimes entra so na chave do cache: se algum CSV mudar, os dados sao relidos
     errors = []
 
     # Capex
@@ -213,13 +262,18 @@ def load_data():
     else:
         errors.append("Ciclo3.csv nao encontrado")
 
-    df_capex = pd.concat([df_c2, df_c3], ignore_index=True) if not df_c2.empty or not df_c3.empty else pd.DataFrame()
+    # Colunas Arrow sao concatenadas como chunks, sem copiar os buffers
+    capex_frames = [df for df in (df_c2, df_c3) if not df.empty]
+    df_capex = pd.concat(capex_frames, ignore_index=True) if capex_frames else pd.DataFrame()
+    if "ufv" in df_capex.columns:
+        # Categoria depois do concat: categorias diferentes por ciclo virariam object
+        df_capex["ufv"] = df_capex["ufv"].astype("category")
 
     # Financeiro
     df_fin = pd.DataFrame()
     if os.path.exists(DATA_FILES["geral"]):
         try:
-            df_fin = pd.read_csv(DATA_FILES["geral"], engine="python")
+            df_fin = read_csv_file(DATA_FILES["geral"])
             df_fin = standardize_fin(df_fin)
         except Exception as exc:
             errors.append(f"Erro ao ler Geral.csv: {exc}")
@@ -228,22 +282,90 @@ def load_data():
     df_fluxo = pd.DataFrame()
     if os.path.exists(DATA_FILES["fluxo"]):
         try:
-            df_fluxo_raw = pd.read_csv(DATA_FILES["fluxo"], engine="python")
+            df_fluxo_raw = read_csv_file(DATA_FILES["fluxo"])
             df_fluxo = normalize_fluxo(df_fluxo_raw)
         except Exception as exc:
             errors.append(f"Erro ao ler Fluxo.csv: {exc}")
+    # So o consolidado por mes e exibido: agrega aqui, dentro do cache
+    fluxo_sum = df_fluxo.groupby("mes", as_index=False)["valor"].sum() if not df_fluxo.empty else pd.DataFrame()
+
+    ufvs_capex = df_capex["ufv"].dropna().unique().tolist() if "ufv" in df_capex.columns else []
+    ufvs_fin = df_fin["ufv_pag"].dropna().unique().tolist() if "ufv_pag" in df_fin.columns else []
+    ufvs = sorted(set(ufvs_capex) | set(ufvs_fin))
+
+    return df_capex, df_fin, fluxo_sum, ufvs, errors
+
 
-    return df_capex, df_fin, df_fluxo, errors
+@st.cache_resource
+def data_cache_state() -> dict:
+    return {"mtimes": None}
+
+
+def clear_stale_data_cache(mtimes: tuple) -> None:
+    # O Streamlit nao apaga entradas antigas do persist="disk": cada nova mtime deixaria um pickle
+    state = data_cache_state()
+    if state["mtimes"] == mtimes:
+        return
+    current = repr(mtimes)
+    try:
+        with open(DATA_CACHE_MARKER, "r", encoding="utf-8") as f:
+            previous = f.read()
+    except OSError:
+        previous = None
+    if previous != current:
+        load_data.clear()
+        try:
+            os.makedirs(os.path.dirname(DATA_CACHE_MARKER), exist_ok=True)
+            with open(DATA_CACHE_MARKER, "w", encoding="utf-8") as f:
+                f.write(current)
+        except OSError:
+            pass
+    state["mtimes"] = mtimes
+
+
+@st.cache_data(show_spinner=False)
+def make_bar(valor_total: float, valor_medido: float, valor_pago: float) -> go.Figure:
+    chart_df = pd.DataFrame(
+        {
+            "Categoria": ["Contratado", "Medido", "Pago"],
+            "Valor": [valor_total, valor_medido, valor_pago],
+        }
+    )
+    return px.bar(chart_df, x="Categoria", y="Valor", text_auto=".2s", color="Categoria")
+
+
+@st.cache_resource
+def get_gauge_template() -> dict:
+    # Compartilhado entre sessoes: go.Indicator copia o dict, nao altere no lugar
+    return {"axis": {"range": [None, 100]}, "bar": {"color": "#1f77b4"}}
+
+
+def make_gauge(avanco_val: float) -> go.Figure:
+    return go.Figure(
+        go.Indicator(
+            mode="gauge+number",
+            value=avanco_val,
+            title={"text": "% Avanco"},
+            gauge=get_gauge_template(),
+        )
+    )
+
+
+@st.cache_data(show_spinner=False)
+def make_fluxo_line(fluxo_sum: pd.DataFrame) -> go.Figure:
+    return px.line(fluxo_sum, x="mes", y="valor", markers=True)
 
 
 st.title("Painel de Gestao - Obras GD")
 
-update_label = last_update_label(list(DATA_FILES.values()))
+mtimes = file_mtimes(list(DATA_FILES.values()))
+update_label = last_update_label(mtimes)
 if update_label:
     st.caption(update_label)
 
 with st.spinner("Carregando dados..."):
-    df_capex, df_fin, df_fluxo, errors = load_data()
+    clear_stale_data_cache(mtimes)
+    df_capex, df_fin, fluxo_sum, ufvs, errors = load_data(mtimes)
 
 if errors:
     st.warning("Alguns arquivos tiveram problemas de leitura. Verifique abaixo.")
@@ -256,10 +378,7 @@ if df_capex.empty:
 
 # Sidebar filters
 st.sidebar.header("Filtros")
-ufvs_capex = df_capex["ufv"].dropna().unique().tolist() if "ufv" in df_capex.columns else []
-ufvs_fin = df_fin["ufv_pag"].dropna().unique().tolist() if (not df_fin.empty and "ufv_pag" in df_fin.columns) else []
-lista_ufvs = sorted(set(ufvs_capex) | set(ufvs_fin))
-lista_ufvs.insert(0, "Todas")
+lista_ufvs = ["Todas"] + ufvs
 
 filtro_ufv = st.sidebar.selectbox("Selecione a UFV", lista_ufvs)
 
@@ -271,9 +390,11 @@ else:
     df_fin_filt = df_fin
 
 # KPIs
-valor_total = df_capex_filt["valor_total"].sum() if "valor_total" in df_capex_filt.columns else 0
-valor_medido = df_capex_filt["fd_medicao"].sum() if "fd_medicao" in df_capex_filt.columns else 0
-saldo_medir = df_capex_filt["saldo_a_medir"].sum() if "saldo_a_medir" in df_capex_filt.columns else 0
+kpi_cols = [c for c in ["valor_total", "fd_medicao", "saldo_a_medir"] if c in df_capex_filt.columns]
+capex_sums = df_capex_filt[kpi_cols].sum() if kpi_cols else pd.Series(dtype="float64")
+valor_total = capex_sums.get("valor_total", 0)
+valor_medido = capex_sums.get("fd_medicao", 0)
+saldo_medir = capex_sums.get("saldo_a_medir", 0)
 valor_pago = df_fin_filt["valor_nf"].sum() if (not df_fin_filt.empty and "valor_nf" in df_fin_filt.columns) else 0
 
 k1, k2, k3, k4 = st.columns(4)
@@ -289,26 +410,13 @@ c1, c2 = st.columns([2, 1])
 
 with c1:
     st.subheader("Contratado vs Medido vs Pago")
-    chart_df = pd.DataFrame(
-        {
-            "Categoria": ["Contratado", "Medido", "Pago"],
-            "Valor": [valor_total, valor_medido, valor_pago],
-        }
-    )
-    fig_bar = px.bar(chart_df, x="Categoria", y="Valor", text_auto=".2s", color="Categoria")
+    fig_bar = make_bar(float(valor_total), float(valor_medido), float(valor_pago))
     st.plotly_chart(fig_bar, use_container_width=True)
 
 with c2:
     st.subheader("Avanco Fisico (medio)")
     avanco_val = pct_from_series(df_capex_filt["avanco_obra"]) if "avanco_obra" in df_capex_filt.columns else 0
-    fig_gauge = go.Figure(
-        go.Indicator(
-            mode="gauge+number",
-            value=avanco_val,
-            title={"text": "% Avanco"},
-            gauge={"axis": {"range": [None, 100]}, "bar": {"color": "#1f77b4"}},
-        )
-    )
+    fig_gauge = make_gauge(float(avanco_val))
     st.plotly_chart(fig_gauge, use_container_width=True)
 
 st.markdown("---")
@@ -332,7 +440,8 @@ present_cols = [c for c in table_cols if c in df_capex_filt.columns]
 df_table = df_capex_filt[present_cols].copy()
 
 if "avanco_obra" in df_table.columns:
-    df_table["avanco_obra"] = df_table["avanco_obra"].apply(lambda x: x * 100 if x <= 1.5 else x)
+    avanco = df_table["avanco_obra"].to_numpy(dtype=np.float64, na_value=np.nan)
+    df_table["avanco_obra"] = np.where(avanco <= 1.5, avanco * 100, avanco)
 
 rename_display = {
     "ufv": "UFV",
@@ -348,19 +457,23 @@ rename_display = {
 df_table = df_table.rename(columns=rename_display)
 
 formatters = {
-    "Contrato Original": "R$ {:,.2f}",
-    "Valor Total": "R$ {:,.2f}",
-    "FD + Medicao": "R$ {:,.2f}",
-    "Saldo a Medir": "R$ {:,.2f}",
-    "Avanco Obra %": "{:.1f}%",
+    "Contrato Original": "R$ %,.2f",
+    "Valor Total": "R$ %,.2f",
+    "FD + Medicao": "R$ %,.2f",
+    "Saldo a Medir": "R$ %,.2f",
+    "Avanco Obra %": "%.1f%%",
+}
+
+# Formato no column_config: sem Styler por celula e as colunas seguem numericas (ordenacao)
+column_config = {
+    col: st.column_config.NumberColumn(format=fmt) for col, fmt in formatters.items() if col in df_table.columns
 }
 
-st.dataframe(df_table.style.format(formatters), use_container_width=True, height=420)
+st.dataframe(df_table, use_container_width=True, height=420, column_config=column_config)
 
 # Fluxo de caixa (apenas consolidado)
-if not df_fluxo.empty and filtro_ufv == "Todas":
+if not fluxo_sum.empty and filtro_ufv == "Todas":
     st.markdown("---")
     st.subheader("Previsao de Fluxo de Caixa")
-    fluxo_sum = df_fluxo.groupby("mes")["valor"].sum().reset_index()
-    fig_fluxo = px.line(fluxo_sum, x="mes", y="valor", markers=True)
+    fig_fluxo = make_fluxo_line(fluxo_sum)
     st.plotly_chart(fig_fluxo, use_container_width=True)